@@ -18,6 +18,7 @@ import sys
 import zipfile
 import urllib.request
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -43,6 +44,18 @@ VOSK_MODEL_URL = "https://alphacephei.com/vosk/models/vosk-model-small-cn-0.22.z
 VOSK_MODEL_ZIP = "vosk-model-small-cn-0.22.zip"
 VOSK_MODEL_DIR = "vosk-model-small-cn-0.22"
 
+# 两遍识别配置：小模型快速转录全部音频，仅对低置信度片段用大模型重新识别
+VOSK_TWO_PASS = False  # 启用前需下载大模型（约1.3GB）
+VOSK_LARGE_MODEL_URL = "https://alphacephei.com/vosk/models/vosk-model-cn-0.22.zip"
+VOSK_LARGE_MODEL_ZIP = "vosk-model-cn-0.22.zip"
+VOSK_LARGE_MODEL_DIR = "vosk-model-cn-0.22"
+VOSK_CONF_THRESHOLD = 0.75  # 片段平均词置信度低于该值时重新识别
+VOSK_SEGMENT_PADDING = 0.3  # 重新识别时片段两侧扩展的秒数
+VOSK_RESCORE_WORKERS = 4  # 并行重新识别的线程数
+
+# 已加载的Vosk模型缓存
+_vosk_models = {}
+
 # 更新为您的 FFmpeg 路径
 FFMPEG_BIN_DIR = r"C:\Users\liuziyu\ffmpeg-2025-07-01-git-11d1b71c31-full_build\bin"
 FFMPEG_PATH = os.path.join(FFMPEG_BIN_DIR, "ffmpeg.exe")
@@ -105,10 +118,10 @@ def convert_to_wav(input_path):
         logger.error(f"音频转换异常: {str(e)}")
         return None
 
-def fix_model_directory():
+def fix_model_directory(model_dir=VOSK_MODEL_DIR):
     """修复模型目录结构"""
     # 检查是否存在嵌套目录
-    nested_dir = os.path.join(VOSK_MODEL_DIR, "vosk-model-small-cn-0.22")
+    nested_dir = os.path.join(model_dir, os.path.basename(model_dir))
     
     if os.path.exists(nested_dir):
         logger.info(f"检测到嵌套目录: {nested_dir}")
@@ -117,7 +130,7 @@ def fix_model_directory():
         # 移动所有文件到父目录
         for item in os.listdir(nested_dir):
             src = os.path.join(nested_dir, item)
-            dst = os.path.join(VOSK_MODEL_DIR, item)
+            dst = os.path.join(model_dir, item)
             
             # 如果目标已存在，先删除
             if os.path.exists(dst):
@@ -134,32 +147,33 @@ def fix_model_directory():
     else:
         logger.info("目录结构正常，无需修复")
 
-def download_and_extract_model():
+def download_and_extract_model(model_url=VOSK_MODEL_URL, model_zip=VOSK_MODEL_ZIP,
+                               model_dir=VOSK_MODEL_DIR):
     """下载并解压Vosk中文模型"""
     # 检查模型目录是否存在
-    if os.path.exists(VOSK_MODEL_DIR):
-        logger.info(f"Vosk模型已存在: {VOSK_MODEL_DIR}")
-        fix_model_directory()  # 确保目录结构正确
+    if os.path.exists(model_dir):
+        logger.info(f"Vosk模型已存在: {model_dir}")
+        fix_model_directory(model_dir)  # 确保目录结构正确
         return True
     
-    logger.info(f"开始下载Vosk中文模型: {VOSK_MODEL_URL}")
+    logger.info(f"开始下载Vosk中文模型: {model_url}")
     
     try:
         # 下载模型
-        urllib.request.urlretrieve(VOSK_MODEL_URL, VOSK_MODEL_ZIP)
-        logger.info(f"模型下载完成: {VOSK_MODEL_ZIP}")
+        urllib.request.urlretrieve(model_url, model_zip)
+        logger.info(f"模型下载完成: {model_zip}")
         
         # 解压模型
-        with zipfile.ZipFile(VOSK_MODEL_ZIP, 'r') as zip_ref:
+        with zipfile.ZipFile(model_zip, 'r') as zip_ref:
             zip_ref.extractall(".")
-        logger.info(f"模型解压完成: {VOSK_MODEL_DIR}")
+        logger.info(f"模型解压完成: {model_dir}")
         
         # 修复目录结构
-        fix_model_directory()
+        fix_model_directory(model_dir)
         
         # 删除ZIP文件
-        os.remove(VOSK_MODEL_ZIP)
-        logger.info(f"已删除临时文件: {VOSK_MODEL_ZIP}")
+        os.remove(model_zip)
+        logger.info(f"已删除临时文件: {model_zip}")
         
         return True
     except Exception as e:
@@ -195,13 +209,94 @@ def create_retry_session():
     session.mount("https://", adapter)
     return session
 
-def transcribe_audio_local(audio_path):
-    """使用本地Vosk引擎进行语音识别"""
+def load_vosk_model(model_dir):
+    """加载Vosk模型（带缓存，避免每次识别都重新加载）"""
+    import vosk
+    
+    if model_dir not in _vosk_models:
+        # 检查关键目录是否存在
+        required_dirs = ["am", "conf", "graph"]
+        for dir_name in required_dirs:
+            dir_path = os.path.join(model_dir, dir_name)
+            if not os.path.exists(dir_path):
+                logger.error(f"关键目录缺失: {dir_path}")
+                return None
+        
+        _vosk_models[model_dir] = vosk.Model(model_dir)
+        logger.info(f"Vosk模型加载成功: {model_dir}")
+    return _vosk_models[model_dir]
+
+def recognize_segments(model, sample_rate, pcm):
+    """第一遍识别：返回按句切分的片段（文本、起止时间、平均词置信度）"""
+    import vosk
+    
+    rec = vosk.KaldiRecognizer(model, sample_rate)
+    rec.SetWords(True)
+    
+    results = []
+    chunk_size = 4000 * 2  # 4000帧，16位采样
+    for offset in range(0, len(pcm), chunk_size):
+        if rec.AcceptWaveform(pcm[offset:offset + chunk_size]):
+            results.append(json.loads(rec.Result()))
+    results.append(json.loads(rec.FinalResult()))
+    
+    segments = []
+    for result in results:
+        words = result.get("result", [])
+        if not words:
+            continue
+        segments.append({
+            "text": result.get("text", ""),
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "conf": sum(w["conf"] for w in words) / len(words)
+        })
+    return segments
+
+def low_confidence_slices(segments, sample_rate, n_bytes,
+                          threshold=VOSK_CONF_THRESHOLD, padding=VOSK_SEGMENT_PADDING):
+    """计算需要重新识别的片段，返回 (片段序号, 起始字节, 结束字节) 列表
+    
+    片段两侧扩展padding秒静音，但不越过相邻片段的词边界，也不超出音频范围
+    """
+    slices = []
+    for i, seg in enumerate(segments):
+        if seg["conf"] >= threshold:
+            continue
+        start = seg["start"] - padding
+        end = seg["end"] + padding
+        if i > 0:
+            start = max(start, segments[i - 1]["end"])
+        if i + 1 < len(segments):
+            end = min(end, segments[i + 1]["start"])
+        start_byte = max(int(start * sample_rate), 0) * 2
+        end_byte = min(int(end * sample_rate) * 2, n_bytes)
+        slices.append((i, start_byte, end_byte))
+    return slices
+
+def redecode_segment(model, sample_rate, pcm_slice):
+    """第二遍识别：用大模型重新识别单个音频片段"""
+    import vosk
+    
+    rec = vosk.KaldiRecognizer(model, sample_rate)
+    rec.AcceptWaveform(pcm_slice)
+    return json.loads(rec.FinalResult()).get("text", "")
+
+def transcribe_audio_local(audio_path, two_pass=None, stats=None):
+    """使用本地Vosk引擎进行语音识别
+    
+    two_pass为None时使用VOSK_TWO_PASS配置；传入stats字典时会写入识别统计信息
+    """
     try:
         import vosk
     except ImportError:
         return "错误: Vosk库未安装，请检查安装"
     
+    if two_pass is None:
+        two_pass = VOSK_TWO_PASS
+    if stats is None:
+        stats = {}
+    
     # 确保模型存在
     if not os.path.exists(VOSK_MODEL_DIR):
         logger.error(f"Vosk模型目录不存在: {VOSK_MODEL_DIR}")
@@ -211,48 +306,134 @@ def transcribe_audio_local(audio_path):
         # 打印模型目录内容以调试
         logger.info(f"模型目录内容: {os.listdir(VOSK_MODEL_DIR)}")
         
-        # 检查关键目录是否存在
-        required_dirs = ["am", "conf", "graph"]
-        for dir_name in required_dirs:
-            dir_path = os.path.join(VOSK_MODEL_DIR, dir_name)
-            if not os.path.exists(dir_path):
-                logger.error(f"关键目录缺失: {dir_path}")
-                return f"错误: 模型不完整，缺失 {dir_name} 目录"
-        
         # 加载模型
-        model = vosk.Model(VOSK_MODEL_DIR)
-        logger.info("Vosk模型加载成功")
+        model = load_vosk_model(VOSK_MODEL_DIR)
+        if model is None:
+            return "错误: 模型不完整，缺失关键目录"
         
-        # 读取音频文件
-        wf = wave.open(audio_path, "rb")
-        if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
-            logger.warning("音频格式不符合要求")
-            return "错误: 音频格式必须是16位PCM单声道WAV"
+        large_model = None
+        if two_pass:
+            if os.path.exists(VOSK_LARGE_MODEL_DIR):
+                large_model = load_vosk_model(VOSK_LARGE_MODEL_DIR)
+            if large_model is None:
+                logger.warning(f"大模型不可用: {VOSK_LARGE_MODEL_DIR}，退回单遍识别")
         
-        # 创建识别器
-        rec = vosk.KaldiRecognizer(model, wf.getframerate())
-        rec.SetWords(True)
-        
-        # 处理音频
-        results = []
-        while True:
-            data = wf.readframes(4000)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                result = json.loads(rec.Result())
-                results.append(result.get("text", ""))
-        
-        # 获取最终结果
-        final_result = json.loads(rec.FinalResult())
-        results.append(final_result.get("text", ""))
+        # 读取音频文件
+        with contextlib.closing(wave.open(audio_path, "rb")) as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
+                logger.warning("音频格式不符合要求")
+                return "错误: 音频格式必须是16位PCM单声道WAV"
+            sample_rate = wf.getframerate()
+            pcm = wf.readframes(wf.getnframes())
+        
+        duration = len(pcm) / (sample_rate * 2)
+        stats.update({
+            "duration": duration,
+            "segments": 0,
+            "redecoded_segments": 0,
+            "redecoded_seconds": 0.0,
+            "redecoded_ratio": 0.0,
+            "first_pass_time": 0.0,
+            "second_pass_time": 0.0
+        })
+        
+        # 第一遍：小模型识别全部音频
+        t0 = time.time()
+        segments = recognize_segments(model, sample_rate, pcm)
+        stats["first_pass_time"] = time.time() - t0
+        stats["segments"] = len(segments)
+        
+        # 第二遍：对低置信度片段用大模型并行重新识别
+        if large_model is not None:
+            low_conf = low_confidence_slices(segments, sample_rate, len(pcm))
+            
+            if low_conf:
+                t0 = time.time()
+                with ThreadPoolExecutor(max_workers=VOSK_RESCORE_WORKERS) as executor:
+                    texts = list(executor.map(
+                        lambda item: redecode_segment(large_model, sample_rate, pcm[item[1]:item[2]]),
+                        low_conf
+                    ))
+                stats["second_pass_time"] = time.time() - t0
+                
+                # 将大模型结果拼接回原位置
+                for (i, start_byte, end_byte), text in zip(low_conf, texts):
+                    if text:
+                        segments[i]["text"] = text
+                    stats["redecoded_seconds"] += (end_byte - start_byte) / (sample_rate * 2)
+                stats["redecoded_segments"] = len(low_conf)
+            
+            if duration > 0:
+                stats["redecoded_ratio"] = stats["redecoded_seconds"] / duration
+            logger.info(f"两遍识别完成: 重新识别 {stats['redecoded_segments']}/{stats['segments']} 个片段，"
+                        f"占音频时长 {stats['redecoded_ratio']:.1%}")
         
-        return " ".join(results).strip()
+        return " ".join(seg["text"] for seg in segments).strip()
     
     except Exception as e:
         logger.error(f"本地语音识别失败: {str(e)}")
         return f"错误: 本地语音识别失败 - {str(e)}"
 
+def benchmark_asr(audio_path):
+    """对比单遍小模型、两遍识别和全量大模型的耗时，并报告重新识别的音频占比"""
+    try:
+        import vosk
+    except ImportError:
+        print("错误: Vosk库未安装 (pip install vosk)")
+        return False
+    
+    # 预先加载模型，避免加载时间计入识别耗时
+    model = load_vosk_model(VOSK_MODEL_DIR) if os.path.exists(VOSK_MODEL_DIR) else None
+    if model is None:
+        print(f"错误: 小模型不可用: {VOSK_MODEL_DIR}")
+        return False
+    large_model = load_vosk_model(VOSK_LARGE_MODEL_DIR) if os.path.exists(VOSK_LARGE_MODEL_DIR) else None
+    
+    wav_path = convert_to_wav(audio_path)
+    if not wav_path:
+        print("错误: 音频格式转换失败")
+        return False
+    
+    try:
+        t0 = time.time()
+        result = transcribe_audio_local(wav_path, two_pass=False)
+        if result.startswith("错误"):
+            print(f"单遍小模型识别失败: {result}")
+            return False
+        print(f"单遍小模型: {time.time() - t0:.2f}秒")
+        
+        if large_model is None:
+            print(f"错误: 大模型不可用: {VOSK_LARGE_MODEL_DIR}，跳过两遍识别和全量大模型测试")
+            return False
+        
+        stats = {}
+        t0 = time.time()
+        result = transcribe_audio_local(wav_path, two_pass=True, stats=stats)
+        if result.startswith("错误"):
+            print(f"两遍识别失败: {result}")
+            return False
+        print(f"两遍识别: {time.time() - t0:.2f}秒 "
+              f"(第一遍 {stats['first_pass_time']:.2f}秒, 第二遍 {stats['second_pass_time']:.2f}秒)")
+        print(f"重新识别: {stats['redecoded_segments']}/{stats['segments']} 个片段, "
+              f"{stats['redecoded_seconds']:.1f}/{stats['duration']:.1f}秒 "
+              f"({stats['redecoded_ratio']:.1%})")
+        
+        with contextlib.closing(wave.open(wav_path, "rb")) as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
+                print("错误: 音频格式必须是16位PCM单声道WAV")
+                return False
+            sample_rate = wf.getframerate()
+            pcm = wf.readframes(wf.getnframes())
+        # 与第一遍相同的分块流式解码路径，保证耗时可比
+        t0 = time.time()
+        recognize_segments(large_model, sample_rate, pcm)
+        print(f"全量大模型: {time.time() - t0:.2f}秒")
+        return True
+    finally:
+        # 删除转换产生的临时文件
+        if wav_path != audio_path and os.path.exists(wav_path):
+            os.remove(wav_path)
+
 def transcribe_audio(audio_path):
     """音频转录主函数"""
     # 检查文件大小
@@ -493,6 +674,11 @@ def check_dependencies():
     if not download_and_extract_model():
         return False
     
+    # 两遍识别需要大模型，下载失败时退回单遍识别
+    if VOSK_TWO_PASS and not download_and_extract_model(
+            VOSK_LARGE_MODEL_URL, VOSK_LARGE_MODEL_ZIP, VOSK_LARGE_MODEL_DIR):
+        logger.warning("大模型下载失败，将仅使用小模型识别")
+    
     return True
 
 # 创建Gradio界面
@@ -646,6 +832,10 @@ if __name__ == "__main__":
     # 禁用SSL警告
     warnings.filterwarnings("ignore", category=InsecureRequestWarning)
     
+    # 识别基准测试: python meeting_assitant_deepseek.py --benchmark 音频文件
+    if len(sys.argv) == 3 and sys.argv[1] == "--benchmark":
+        sys.exit(0 if benchmark_asr(sys.argv[2]) else 1)
+    
     # 打印配置信息
     print(f"DeepSeek文本API端点: {CHAT_API_URL}")
     print(f"FFmpeg路径: {FFMPEG_PATH}")